@@ -1,3 +1,4 @@
+from backend.subsymbolic.llm_throttle import LLMOverloadedError
 from backend.utils.logger import setup_logger
 
 class QuestionClassifier:
@@ -36,12 +37,14 @@ class QuestionClassifier:
             response = self.gemini_api.llm.invoke(self.classification_prompt.format(query=query))
             classification = response.strip().lower()
             if classification not in ['symbolic', 'sub-symbolic']:
-                self.logger.warning(f"Invalid classification response: {classification}, defaulting to sub-symbolic")
+                self.logger.warning("Invalid classification response, defaulting to sub-symbolic", extra={"fields": {"classification": classification}})
                 return 0.5, False
             is_symbolic = classification == 'symbolic'
             confidence = 0.9 if classification in ['symbolic', 'sub-symbolic'] else 0.5 
-            self.logger.info(f"Classified query '{query}' as {classification}")
+            self.logger.info("Classified query", extra={"fields": {"query": query, "classification": classification}})
             return confidence, is_symbolic
+        except LLMOverloadedError:
+            raise
         except Exception as e:
-            self.logger.error(f"Error classifying query: {str(e)}")
+            self.logger.error("Error classifying query: %s", e)
             return 0.0, False
\ No newline at end of file
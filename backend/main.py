@@ -1,10 +1,13 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
+from typing import Optional
 from backend.classifier.qxn_classifier import QuestionClassifier
 from backend.subsymbolic.gemini_api import GeminiAPI
+from backend.subsymbolic.llm_throttle import PRIORITY_BULK, LLMOverloadedError
 from backend.symbolic.metta_reasoner import MettaReasoner
 from backend.utils.config import GOOGLE_API_KEY
-from backend.utils.logger import setup_logger
+from backend.utils.logger import new_request_id, setup_logger
+import threading
 import uuid
 import os
 
@@ -18,21 +21,27 @@ metta_reasoner = MettaReasoner(gemini_api=gemini_api)
 
 
 CUSTOM_FACTS_PATH = os.path.join(os.path.dirname(metta_reasoner.kb_path), "custom_facts.metta")
+# Serializes writes to custom_facts.metta and the KB reloads that read it.
+facts_lock = threading.Lock()
 
 class QueryRequest(BaseModel):
     query: str
 
 @app.post("/query")
-async def handle_query(request: QueryRequest):
+def handle_query(request: QueryRequest):
     try:
+        new_request_id()
         query = request.query.strip()
-        logger.info(f"Received query: {query}")
+        logger.info("Received query", extra={"fields": {"query": query}})
 
         # Custom "clear facts" command
         if query.lower().strip() == "clear facts":
-            metta_reasoner.load_default_kb()
-            if os.path.exists(CUSTOM_FACTS_PATH):
-                os.remove(CUSTOM_FACTS_PATH)
+            with facts_lock:
+                metta_reasoner.load_default_kb()
+                had_custom_facts = os.path.exists(CUSTOM_FACTS_PATH)
+                if had_custom_facts:
+                    os.remove(CUSTOM_FACTS_PATH)
+            if had_custom_facts:
                 logger.info("custom_facts.metta deleted. Default facts will be loaded.")
                 return {"response": "All custom facts cleared. Default knowledge base loaded.", "source": "system"}
             else:
@@ -42,32 +51,26 @@ async def handle_query(request: QueryRequest):
         # Custom "add new facts"
         if query.lower().startswith("add new facts"):
             lines = [line.strip() for line in query.split('>')[1:] if line.strip()]
-            added_facts = []
-            with open(CUSTOM_FACTS_PATH, "w") as f:
-                f.write("!(bind! &medical_kb (new-space))" + "\n")
-                for info_text in lines:
-                    info_id = f"FACT{uuid.uuid4().hex[:8]}"
-                    metta_fact = parse_natural_fact_to_metta(info_text, gemini_api, info_id)
-                    f.write(metta_fact + "\n")
-                    added_facts.append(metta_fact)
-            metta_reasoner.load_custome_kb()
-            logger.info("Facts replaced:\n" + "\n".join(added_facts))
+            added_facts = parse_facts(lines)
+            with facts_lock:
+                with open(CUSTOM_FACTS_PATH, "w") as f:
+                    f.write("!(bind! &medical_kb (new-space))" + "\n")
+                    for metta_fact in added_facts:
+                        f.write(metta_fact + "\n")
+                metta_reasoner.load_custome_kb()
+            logger.info("Facts replaced", extra={"fields": {"count": len(added_facts), "facts": "\n".join(added_facts)}})
             return {"response": "Facts replaced:\n" + "\n".join(added_facts), "source": "system"}
 
         # Custom "add facts" command
         if query.lower().startswith("add facts"):
             lines = [line.strip() for line in query.split('>')[1:] if line.strip()]
-            added_facts = []
-            file_exists = os.path.exists(CUSTOM_FACTS_PATH)
-            write_header = not file_exists or os.path.getsize(CUSTOM_FACTS_PATH) == 0
-            with open(CUSTOM_FACTS_PATH, "a") as f:
-                for info_text in lines:
-                    info_id = f"FACT{uuid.uuid4().hex[:8]}"
-                    metta_fact = parse_natural_fact_to_metta(info_text, gemini_api, info_id)
-                    f.write(metta_fact + "\n")
-                    added_facts.append(metta_fact)
-            metta_reasoner.load_custome_kb()
-            logger.info("Facts added:\n" + "\n".join(added_facts))
+            added_facts = parse_facts(lines)
+            with facts_lock:
+                with open(CUSTOM_FACTS_PATH, "a") as f:
+                    for metta_fact in added_facts:
+                        f.write(metta_fact + "\n")
+                metta_reasoner.load_custome_kb()
+            logger.info("Facts added", extra={"fields": {"count": len(added_facts), "facts": "\n".join(added_facts)}})
             return {"response": "Facts added:\n" + "\n".join(added_facts), "source": "system"}
 
         # Classify query
@@ -84,10 +87,40 @@ async def handle_query(request: QueryRequest):
             logger.info("Query routed to sub-symbolic AI")
 
         return {"response": response, "source": source}
+    except LLMOverloadedError as e:
+        logger.warning("Rejected query, LLM queue is full: %s", e)
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        logger.error(f"Error processing query: {str(e)}")
+        logger.exception("Error processing query: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/differentials")
+def get_differentials(
+    patient: Optional[str] = None,
+    min_fraction: float = Query(0.5, ge=0.0, le=1.0),
+    limit: int = Query(5, ge=1),
+    offset: int = Query(0, ge=0),
+    page_size: int = Query(100, ge=1, le=500),
+):
+    try:
+        new_request_id()
+        patients = [patient] if patient else None
+        total, differentials = metta_reasoner.differentials.rank(
+            patients, min_fraction=min_fraction, limit=limit, offset=offset, page_size=page_size
+        )
+        logger.info("Ranked differentials", extra={"fields": {"patient": patient, "total": total}})
+        return {"differentials": differentials, "total": total, "offset": offset, "source": "symbolic"}
+    except Exception as e:
+        logger.exception("Error ranking differentials: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def parse_facts(lines):
+    # LLM calls happen before facts_lock is taken so slow parsing never blocks other fact updates.
+    return [
+        parse_natural_fact_to_metta(info_text, gemini_api, f"FACT{uuid.uuid4().hex[:8]}")
+        for info_text in lines
+    ]
+
 def parse_natural_fact_to_metta(info_text, gemini_api, info_id):
     prompt = f"""
 You are an expert in symbolic AI for medical expert systems.
@@ -168,5 +201,5 @@ Output: !(add-atom &medical_kb (: HISTORY{info_id} (HasPhysicalFinding patient1
 Input: {info_text} and {info_id} is the unique identifier for this info.
 Output:
 """
-    metta_fact = gemini_api.llm.invoke(prompt)
+    metta_fact = gemini_api.llm.invoke(prompt, priority=PRIORITY_BULK)
     return metta_fact.strip()
\ No newline at end of file
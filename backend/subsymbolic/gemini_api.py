@@ -1,19 +1,32 @@
 from langchain_google_genai import GoogleGenerativeAI
+from backend.subsymbolic.kb_context import KBContextIndex
+from backend.subsymbolic.llm_throttle import LLMOverloadedError, ThrottledLLM, TokenBucketLimiter
+from backend.utils.config import (
+    LLM_BURST,
+    LLM_INTERACTIVE_RESERVE,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_QUEUE,
+    LLM_RATE_PER_SEC,
+    RAG_CONTEXT_TOKEN_BUDGET,
+)
 from backend.utils.logger import setup_logger
 
 class GeminiAPI:
     def __init__(self, api_key):
         self.api_key = api_key
         self.logger = setup_logger()
-        self.llm = GoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=api_key)
-        self.rag_context = """
-        Respiratory Disease Context:
-        - Patient1 presents with persistent cough, shortness of breath, chest pain, wheezing, fever, night sweats, weight loss, fatigue, productive cough, hemoptysis, dyspnea, chest tightness, tachypnea, cyanosis, hoarseness, orthopnea, and paroxysmal nocturnal dyspnea.
-        - Test results: chest x-ray shows infiltrates, CT chest shows pulmonary nodules and emphysematous changes, spirometry shows obstructive pattern, peak flow shows reduced values, pulse oximetry shows hypoxemia, sputum culture shows bacterial growth, tuberculin skin test is positive, bronchoscopy shows malignant tissue, arterial blood gas shows respiratory acidosis, allergy panel shows environmental allergens, methacholine challenge shows bronchial hyperreactivity, chest x-ray shows pleural effusion and pneumothorax, CT pulmonary angiogram shows pulmonary embolus, echocardiogram shows left heart failure, D-dimer is elevated.
-        - Risk factors: tobacco use disorder, occupational dust exposure, family history of atopy, advanced age, immunosuppression, recent travel history, allergen exposure, prolonged immobilization, cardiovascular comorbidity, previous pulmonary disease.
-        - Medical history: childhood asthma, previous pneumonia, tuberculosis exposure, malignancy history, thromboembolic events.
-        - Physical findings: decreased breath sounds, rales.
-        """
+        limiter = TokenBucketLimiter(
+            rate=LLM_RATE_PER_SEC,
+            burst=LLM_BURST,
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            max_queue=LLM_MAX_QUEUE,
+            interactive_reserve=LLM_INTERACTIVE_RESERVE,
+        )
+        self.llm = ThrottledLLM(
+            GoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=api_key),
+            limiter,
+        )
+        self.kb_context = KBContextIndex()
 
     def answer_query(self, query):
         try:
@@ -23,9 +36,14 @@ class GeminiAPI:
             Context:
             {context}
             """
-            prompt = f"{system_prompt.format(context=self.rag_context)}\nUser Query: {query}"
+            context = self.kb_context.build_context(query, RAG_CONTEXT_TOKEN_BUDGET)
+            if not context:
+                context = "No patient facts in the knowledge base match this query."
+            prompt = f"{system_prompt.format(context=context)}\nUser Query: {query}"
             response = self.llm.invoke(prompt)
             return response
+        except LLMOverloadedError:
+            raise
         except Exception as e:
-            self.logger.error(f"Error answering query: {str(e)}")
+            self.logger.error("Error answering query: %s", e)
             return "Sorry, I couldn't process that query."
\ No newline at end of file
@@ -0,0 +1,120 @@
+import re
+import threading
+from backend.symbolic.facts import parse_findings
+
+TOPICS = {
+    "Presents": "Symptoms",
+    "Shows": "Test results",
+    "HasRiskFactor": "Risk factors",
+    "HasMedicalHistory": "Medical history",
+    "HasPhysicalFinding": "Physical findings",
+}
+
+
+STOPWORDS = {
+    "about", "and", "are", "can", "does", "explain", "for", "from", "has", "have",
+    "how", "is", "of", "patient", "result", "results", "role", "show", "shows", "test",
+    "tests", "that", "the", "this", "what", "when", "which", "who", "why", "with",
+}
+
+
+def _terms(text):
+    """Lowercase terms of text, split on anything that is not a letter or digit
+    (so "d-dimer" and "d_dimer" agree), minus stopwords and one-letter terms.
+    Hyphenated words also contribute their joined form, so "x-ray" matches "xray"."""
+    text = text.lower()
+    terms = set(re.findall(r"[a-z0-9]+", text))
+    terms.update(word.replace("-", "") for word in re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)+", text))
+    return {term for term in terms if len(term) > 1 and term not in STOPWORDS}
+
+
+def _estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+class KBContextIndex:
+    """Index of knowledge-base facts by patient, topic and term, used to build a
+    small, query-specific context for GeminiAPI.answer_query.
+
+    sync() is called with the full facts text every time the MeTTa space is
+    loaded; when the new text only appends to what was indexed last time, just
+    the appended facts are parsed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._source = ""
+        self._facts = {}
+        self._by_term = {}
+
+    def sync(self, facts_str):
+        with self._lock:
+            if facts_str.startswith(self._source):
+                new_text = facts_str[len(self._source):]
+            else:
+                self._facts = {}
+                self._by_term = {}
+                new_text = facts_str
+            self._source = facts_str
+            self._add(new_text)
+
+    def _add(self, text):
+        for predicate, patient, test, value in parse_findings(text):
+            phrase = value.replace("_", " ")
+            if test is not None:
+                phrase = f"{test.replace('_', ' ')} shows {phrase}"
+            topic = TOPICS[predicate]
+            phrases = self._facts.setdefault(patient, {}).setdefault(topic, {})
+            if phrase in phrases:
+                continue
+            phrases[phrase] = len(phrases)
+            for term in _terms(phrase):
+                self._by_term.setdefault(term, set()).add((patient, topic, phrase))
+
+    def build_context(self, query, token_budget):
+        """Render the facts relevant to query, most relevant first, within token_budget.
+
+        When the query names patients only their facts are candidates, ranked by
+        overlap with the query terms; otherwise facts of any patient sharing a
+        term with the query are. Returns "" when nothing matches.
+        """
+        query_terms = _terms(query)
+        query_words = set(re.findall(r"[a-z0-9_]+", query.lower()))
+        with self._lock:
+            mentioned = [p for p in self._facts if p.lower() in query_words]
+            if mentioned:
+                # A named patient scopes the context to that patient's facts.
+                candidates = {
+                    (patient, topic, phrase)
+                    for patient in mentioned
+                    for topic, phrases in self._facts[patient].items()
+                    for phrase in phrases
+                }
+            else:
+                candidates = set()
+                for term in query_terms:
+                    candidates |= self._by_term.get(term, set())
+
+            positions = {fact: self._facts[fact[0]][fact[1]][fact[2]] for fact in candidates}
+        topic_order = {topic: i for i, topic in enumerate(TOPICS.values())}
+
+        def score(fact):
+            # Within an overlap tier, take facts round-robin across topics (symptoms
+            # and test results first) so one long topic cannot fill the budget.
+            patient, topic, phrase = fact
+            overlap = len(_terms(phrase) & query_terms) + (topic.lower() in query.lower())
+            return (-overlap, positions[fact], topic_order[topic], patient, phrase)
+
+        selected = {}
+        used = 0
+        for patient, topic, phrase in sorted(candidates, key=score):
+            cost = _estimate_tokens(phrase) + (0 if (patient, topic) in selected else 6)
+            if used + cost > token_budget:
+                break
+            used += cost
+            selected.setdefault((patient, topic), []).append(phrase)
+
+        return "\n".join(
+            f"- {patient} {topic.lower()}: {', '.join(phrases)}."
+            for (patient, topic), phrases in sorted(selected.items(), key=lambda item: (item[0][0], topic_order[item[0][1]]))
+        )
@@ -0,0 +1,183 @@
+import heapq
+import itertools
+import threading
+import time
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+class LLMOverloadedError(Exception):
+    """Raised when the LLM request queue is too deep to accept more work."""
+
+
+class _Call:
+    def __init__(self, context):
+        self.done = threading.Event()
+        self.context = context
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces identical in-flight calls so only one of them does the work."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, context=None, on_join=None):
+        """Run fn() for key, or wait for the call already in flight.
+
+        The leader's context is stored on the call; callers that join it get
+        on_join(context) before waiting.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call(context)
+                self._calls[key] = call
+
+        if not leader:
+            if on_join is not None:
+                on_join(call.context)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq")
+
+    def __init__(self, priority, seq):
+        self.priority = priority
+        self.seq = seq
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class TokenBucketLimiter:
+    """Token bucket with a concurrency cap and a priority-ordered wait queue.
+
+    Lower priority values are served first. Interactive callers are rejected
+    with LLMOverloadedError once max_queue requests are waiting; other callers
+    are rejected interactive_reserve slots earlier, so bulk work cannot crowd
+    interactive queries out of the queue.
+    """
+
+    def __init__(self, rate, burst, max_concurrency, max_queue, interactive_reserve=0):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        if burst < 1:
+            raise ValueError(f"burst must be at least 1, got {burst}")
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
+        if max_queue < 1:
+            raise ValueError(f"max_queue must be at least 1, got {max_queue}")
+        if not 0 <= interactive_reserve < max_queue:
+            raise ValueError(f"interactive_reserve must be in [0, max_queue), got {interactive_reserve}")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.interactive_reserve = interactive_reserve
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._active = 0
+        self._waiting = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def new_ticket(self, priority=PRIORITY_INTERACTIVE):
+        return _Ticket(priority, next(self._counter))
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, ticket=None):
+        if ticket is None:
+            ticket = self.new_ticket(priority)
+        with self._cond:
+            limit = self.max_queue
+            if ticket.priority > PRIORITY_INTERACTIVE:
+                limit -= self.interactive_reserve
+            if len(self._waiting) >= limit:
+                raise LLMOverloadedError(
+                    f"LLM queue is full ({len(self._waiting)} requests waiting)"
+                )
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] is ticket and self._active < self.max_concurrency:
+                        self._refill()
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            self._active += 1
+                            heapq.heappop(self._waiting)
+                            self._cond.notify_all()
+                            return
+                        timeout = (1 - self._tokens) / self.rate
+                    self._cond.wait(timeout)
+            except BaseException:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                raise
+
+    def promote(self, ticket, priority):
+        """Raise a waiting ticket to priority if that is more urgent."""
+        with self._cond:
+            if priority >= ticket.priority:
+                return
+            ticket.priority = priority
+            if ticket in self._waiting:
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+
+class ThrottledLLM:
+    """Wraps an LLM client so invoke() is coalesced and rate limited."""
+
+    def __init__(self, llm, limiter):
+        self.llm = llm
+        self.limiter = limiter
+        self._flight = SingleFlight()
+
+    def invoke(self, prompt, priority=PRIORITY_INTERACTIVE):
+        ticket = self.limiter.new_ticket(priority)
+        return self._flight.do(
+            prompt,
+            lambda: self._invoke(prompt, ticket),
+            context=ticket,
+            on_join=lambda leader_ticket: self.limiter.promote(leader_ticket, priority),
+        )
+
+    def _invoke(self, prompt, ticket):
+        self.limiter.acquire(ticket=ticket)
+        try:
+            return self.llm.invoke(prompt)
+        finally:
+            self.limiter.release()
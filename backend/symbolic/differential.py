@@ -0,0 +1,122 @@
+import re
+import numpy as np
+from backend.symbolic.facts import parse_findings
+
+DIAGNOSIS_RULE_PATTERN = re.compile(
+    r"\(: (\w+_diagnosis_rule)(.*?)\(DiagnosedWith \$patient (\w+)\)", re.DOTALL
+)
+
+# Number of set bits for every possible byte value.
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _findings(text):
+    """Yield (patient, finding) pairs, where finding is the fact with the patient
+    replaced by $patient so it lines up with rule premises."""
+    for predicate, patient, test, value in parse_findings(text):
+        if test is None:
+            yield patient, f"({predicate} $patient {value})"
+        else:
+            yield patient, f"({predicate} {test} $patient {value})"
+
+
+def parse_diagnosis_rules(rules_str):
+    """Return (rule, diagnosis, premises) for every *_diagnosis_rule."""
+    text = "\n".join(line for line in rules_str.splitlines() if not line.lstrip().startswith(";"))
+    rules = []
+    for m in DIAGNOSIS_RULE_PATTERN.finditer(text):
+        premises = [finding for patient, finding in _findings(m.group(2)) if patient == "$patient"]
+        if premises:
+            rules.append((m.group(1), m.group(3), list(dict.fromkeys(premises))))
+    return rules
+
+
+class DifferentialRanker:
+    """Ranks every patient against every diagnosis rule by the fraction of rule
+    premises their facts satisfy.
+
+    Patients are rows of a packed bitset over the findings used by the rules and
+    each rule is a packed premise mask, so the whole patient x rule match table
+    is a single AND + popcount.
+    """
+
+    def __init__(self, facts_str, rules_str):
+        self.rules = parse_diagnosis_rules(rules_str)
+        self.findings = list(dict.fromkeys(p for _, _, premises in self.rules for p in premises))
+        self._finding_index = finding_index = {finding: i for i, finding in enumerate(self.findings)}
+
+        patient_index = {}
+        rows, cols = [], []
+        for patient, finding in _findings(facts_str):
+            col = finding_index.get(finding)
+            if col is None:
+                continue
+            rows.append(patient_index.setdefault(patient, len(patient_index)))
+            cols.append(col)
+        self.patients = list(patient_index)
+        self._patient_index = patient_index
+
+        present = np.zeros((len(self.patients), len(self.findings)), dtype=bool)
+        present[rows, cols] = True
+        masks = np.zeros((len(self.rules), len(self.findings)), dtype=bool)
+        for r, (_, _, premises) in enumerate(self.rules):
+            masks[r, [finding_index[p] for p in premises]] = True
+
+        self._present = np.packbits(present, axis=1)
+        self._masks = np.packbits(masks, axis=1)
+        self._premise_counts = masks.sum(axis=1)
+
+    def _select(self, patients):
+        if patients is None:
+            return self.patients, self._present
+        names = [p for p in patients if p in self._patient_index]
+        return names, self._present[[self._patient_index[p] for p in names]]
+
+    def _match(self, bits):
+        """counts[i, r] = premises of rule r met by the patient in bits row i."""
+        overlap = np.bitwise_and(bits[:, None, :], self._masks[None, :, :])
+        return _POPCOUNT[overlap].sum(axis=2, dtype=np.int32)
+
+    def rank(self, patients=None, min_fraction=0.0, limit=5, offset=0, page_size=100):
+        """Return (total, page) of each patient's best-matching diagnoses.
+
+        total counts every (patient, rule) match at or above min_fraction within
+        each patient's top limit rules; page holds results offset to
+        offset + page_size, each with its missing findings.
+        """
+        names, bits = self._select(patients)
+        if not names or not self.rules:
+            return 0, []
+        counts = self._match(bits)
+        fractions = counts / self._premise_counts
+        order = np.argsort(-fractions, axis=1, kind="stable")[:, :limit]
+        keep = (np.take_along_axis(fractions, order, axis=1) >= min_fraction) & (
+            np.take_along_axis(counts, order, axis=1) > 0
+        )
+
+        rows, ks = np.nonzero(keep)
+        total = len(rows)
+        rows, ks = rows[offset:offset + page_size], ks[offset:offset + page_size]
+        rule_ids = order[rows, ks]
+
+        # Premises each selected rule needs that its patient lacks, for the whole page at once.
+        missing = np.unpackbits(
+            np.bitwise_and(self._masks[rule_ids], np.invert(bits[rows])), axis=1, count=len(self.findings)
+        )
+        result_idx, finding_idx = np.nonzero(missing)
+        missing_by_result = np.split(finding_idx, np.searchsorted(result_idx, np.arange(1, len(rows))))
+
+        results = []
+        for i, r, missing_ids in zip(rows.tolist(), rule_ids.tolist(), missing_by_result):
+            patient = names[i]
+            rule, diagnosis, _ = self.rules[r]
+            results.append({
+                "patient": patient,
+                "diagnosis": diagnosis,
+                "rule": rule,
+                "matched": int(counts[i, r]),
+                "total": int(self._premise_counts[r]),
+                "fraction": round(float(fractions[i, r]), 3),
+                "missing": [self.findings[f].replace("$patient", patient) for f in missing_ids.tolist()],
+            })
+        return total, results
@@ -0,0 +1,19 @@
+import re
+
+FINDING_PATTERN = re.compile(
+    r"\((?:(Presents|HasRiskFactor|HasMedicalHistory|HasPhysicalFinding) ([^\s()]+) ([^\s()]+)"
+    r"|Shows ([^\s()]+) ([^\s()]+) ([^\s()]+))\)"
+)
+
+
+def parse_findings(text):
+    """Yield (predicate, patient, test, value) for every patient finding in MeTTa
+    text, skipping comment lines. test is None for every predicate except Shows."""
+    for line in text.splitlines():
+        if line.lstrip().startswith(";"):
+            continue
+        for m in FINDING_PATTERN.finditer(line):
+            if m.group(1):
+                yield m.group(1), m.group(2), None, m.group(3)
+            else:
+                yield "Shows", m.group(5), m.group(4), m.group(6)
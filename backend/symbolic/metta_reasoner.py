@@ -1,5 +1,9 @@
+import logging
 import os
+import threading
 from hyperon import MeTTa
+from backend.subsymbolic.llm_throttle import LLMOverloadedError
+from backend.symbolic.differential import DifferentialRanker
 from backend.utils.logger import setup_logger
 # from backend.symbolic.fcc_interpreter import FCCInterpreter
 
@@ -10,27 +14,19 @@ class MettaReasoner:
         self.kb_path = os.path.join(os.path.dirname(__file__), "kb.metta")
         self.ai_path = os.path.join(os.path.dirname(__file__), "symbolic_ai.metta")
         self.rules_path = os.path.join(os.path.dirname(__file__), "rules.metta")
+        self.lock = threading.Lock()
         self.load_default_kb()
 
     def load_default_kb(self):
-        self.metta = MeTTa()
         with open(self.kb_path) as file:
             kb_str = file.read()
         self.logger.info("Loading facts from kb.metta")
-        with open(self.rules_path) as file:
-            rules_str = file.read()
-        with open(self.ai_path) as file:
-            ai_str = file.read()
+        self._load_space(kb_str)
 
-        self.metta.run(kb_str)
-        self.metta.run(rules_str)
-        self.metta.run(ai_str)
-    
     def load_custome_kb(self):
 
         custom_facts_path = os.path.join(os.path.dirname(self.kb_path), "custom_facts.metta")
         use_custom = os.path.exists(custom_facts_path) and os.path.getsize(custom_facts_path) > 0
-        self.metta = MeTTa()
         if use_custom:
             with open(custom_facts_path) as file:
                 kb_str = file.read()
@@ -39,14 +35,39 @@ class MettaReasoner:
             self.logger.info("No custom facts found. Using default knowledge base.")
             self.load_default_kb()
             return
+        self._load_space(kb_str)
+
+    def _load_space(self, kb_str):
+        # Build the new space fully before swapping it in, so concurrent queries
+        # never run against a half-loaded KB.
         with open(self.rules_path) as file:
             rules_str = file.read()
         with open(self.ai_path) as file:
             ai_str = file.read()
 
-        self.metta.run(kb_str)
-        self.metta.run(rules_str)
-        self.metta.run(ai_str)
+        metta = MeTTa()
+        metta.run(kb_str)
+        metta.run(rules_str)
+        metta.run(ai_str)
+        with self.lock:
+            self.metta = metta
+            self._facts_str = kb_str
+            self._rules_str = rules_str
+            self._differentials = None
+        self.gemini_api.kb_context.sync(kb_str)
+
+    @property
+    def differentials(self):
+        """DifferentialRanker for the loaded KB, built on first use after each reload."""
+        with self.lock:
+            ranker, facts_str, rules_str = self._differentials, self._facts_str, self._rules_str
+        if ranker is None:
+            ranker = DifferentialRanker(facts_str, rules_str)
+            with self.lock:
+                if self._facts_str is facts_str:
+                    self._differentials = ranker
+        return ranker
+
     def convert_query_to_metta(self, query):
         prompt = f"""
                     You are an expert assistant for a symbolic AI medical diagnosis system using the MeTTa language. Your task is to convert natural language queries about respiratory illnesses into valid MeTTa function calls for reasoning.
@@ -194,14 +215,16 @@ class MettaReasoner:
         try:
             response = self.gemini_api.llm.invoke(prompt)
             response = response.strip()
-            self.logger.info(f"Converted query to MeTTa: {response}")
+            self.logger.info("Converted query to MeTTa", extra={"fields": {"metta_query": response}})
             if response[2] == "b":
                 intent = "bc"
             elif response[2] == "f":
                 intent = "fcc"
             return response, intent
+        except LLMOverloadedError:
+            raise
         except Exception as e:
-            self.logger.error(f"Error converting query to MeTTa: {str(e)}")
+            self.logger.error("Error converting query to MeTTa: %s", e)
             return None
     
     def interpret_metta_response(self, intent, response):
@@ -297,19 +320,26 @@ class MettaReasoner:
                 Output:
                 """
         try:
-            response = self.gemini_api.llm.invoke(interpret_prompt)
-            self.logger.info(f"Interpreted MeTTa response: {response.strip()}")
-            return response.strip()
+            response = self.gemini_api.llm.invoke(interpret_prompt).strip()
+            self.logger.info("Interpreted MeTTa response", extra={"fields": {"interpretation_chars": len(response)}})
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Interpretation", extra={"fields": {"interpretation": response}})
+            return response
+        except LLMOverloadedError:
+            raise
         except Exception as e:  
-            self.logger.error(f"Error interpreting MeTTa response: {str(e)}")
+            self.logger.error("Error interpreting MeTTa response: %s", e)
             return "Sorry, I couldn't interpret the response."
 
     def process_query(self, query):
         response, intent = self.convert_query_to_metta(query)
         if response == "Illness not supported.":
             return response
-        metta_response = self.metta.run(response)
-        self.logger.info(f"MeTTa response: {metta_response}")
+        with self.lock:
+            metta_response = self.metta.run(response)
+        self.logger.info("MeTTa query returned", extra={"fields": {"result_sets": len(metta_response)}})
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("MeTTa response", extra={"fields": {"metta_response": metta_response}})
         interpreted_response = self.interpret_metta_response(intent, metta_response)
         
         return interpreted_response
\ No newline at end of file
@@ -1,9 +1,110 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import uuid
+
+DEFAULT_MAX_FIELD_CHARS = 2000
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+_listener = None
+
+
+def new_request_id():
+    request_id = uuid.uuid4().hex[:12]
+    request_id_var.set(request_id)
+    return request_id
+
+
+def truncate(value, limit=DEFAULT_MAX_FIELD_CHARS):
+    text = value if isinstance(value, str) else str(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} chars truncated]"
+
+
+class _ContextFilter(logging.Filter):
+    """Runs on the caller's thread: samples debug records, stamps the request id
+    and caps payload fields before the record is queued."""
+
+    def __init__(self, max_field_chars, debug_sample_rate):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and random.random() >= self.debug_sample_rate:
+            return False
+        record.request_id = request_id_var.get()
+        fields = getattr(record, "fields", None)
+        if fields:
+            record.fields = {
+                key: value if isinstance(value, (int, float, bool)) or value is None else truncate(value, self.max_field_chars)
+                for key, value in fields.items()
+            }
+        return True
+
+
+class _StructuredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry["fields"] = fields
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
 
 def setup_logger():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        filename='law_expert_system.log'
+    global _listener
+    logger = logging.getLogger()
+    if _listener is not None:
+        return logger
+
+    # Settings are read here rather than from config.py so the logger can be
+    # used without GOOGLE_API_KEY set.
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.getenv("LOG_FILE", "law_expert_system.log"),
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
     )
-    return logging.getLogger()
\ No newline at end of file
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(_ContextFilter(
+        max_field_chars=int(os.getenv("LOG_MAX_FIELD_CHARS", str(DEFAULT_MAX_FIELD_CHARS))),
+        debug_sample_rate=float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1")),
+    ))
+
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return logger